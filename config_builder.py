@@ -14,17 +14,33 @@ Options:
   -c, --capabilities  List device capabilities and exit.
   -g, --grab          Other applications will not receive events from
                       the selected devices while evtest is running.
+  -l, --learn         Capture codes from all the selected devices without
+                      prompting, mappings are read from --batch or --socket.
+  -b, --batch=FILE    Mapping definitions to apply when learning stops.
+  -s, --socket=PATH   Listen for mapping definitions on a unix socket while
+                      learning.
+  -t, --try           Run keys that already have a mapping through the
+                      remappy engine so new mappings can be tried out.
+  --fake              With --try, print what would be sent instead of
+                      writing to a real virtual device.
+
+Mapping definitions are one per line: <target> <layer> <mode> <value>
+where target is @N for the Nth code captured, or a scancode, and mode is
+s (short), m (macro) or l (layer).
 
 Examples:
   evtest /dev/input/event0 /dev/input/event1
+  config_builder.py --learn --batch mouse.txt /dev/input/event5
 '''
 
 
 from __future__ import print_function
 
+import os
 import re
 import sys
 import json
+import socket
 import select
 import atexit
 import termios
@@ -38,12 +54,22 @@ except NameError:
 import evdev
 from evdev import ecodes, list_devices, AbsInfo, InputDevice
 
+from libs.learn import Capture, parse_definition, make_map
+from libs.engine import Engine, Fake_UInput, compiled_name
+from libs.store import save_tables
+from libs.compiler import compile_config, compile_map, get_scancode
+
 
 def parseopt():
     parser = optparse.OptionParser(add_help_option=False)
     parser.add_option('-h', '--help', action='store_true')
     parser.add_option('-g', '--grab', action='store_true')
     parser.add_option('-c', '--capabilities', action='store_true')
+    parser.add_option('-l', '--learn', action='store_true')
+    parser.add_option('-b', '--batch')
+    parser.add_option('-s', '--socket')
+    parser.add_option('-t', '--try', action='store_true', dest='try_out')
+    parser.add_option('--fake', action='store_true')
     return parser.parse_args()
 
 
@@ -80,8 +106,17 @@ def main():
     except FileNotFoundError:
         config = {"maps": [], 'name': devices[0].name}
 
+    engine = build_engine(config)
+    if opts.try_out:
+        engine.ui = Fake_UInput(ecodes.KEY) if opts.fake else evdev.UInput()
+        atexit.register(engine.close)
+
     # save configs on exit
-    atexit.register(save_config, config)
+    atexit.register(save_config, config, engine=engine)
+
+    if opts.learn or opts.batch or opts.socket:
+        return learn(devices, config, engine, opts.batch, opts.socket)
+
     # print(devices[0])
     print('Listening for events, changes saved automatically (press ctrl-c to exit) ...')
     fd_to_device = {dev.fd: dev for dev in devices}
@@ -91,10 +126,43 @@ def main():
         for fd in r:
             for event in fd_to_device[fd].read():
                 # print_event(event)
-                add_to_config(event, config)
+                if try_out(event, engine):
+                    continue
+                add_to_config(event, config, engine)
+
+
+def build_engine(config):
+    '''
+    Compile the config into an engine one map at a time, so that a bad map
+    is reported instead of stopping the builder.
+    '''
+    engine = Engine(compile_config({'name': config.get('name', None), 'maps': []}))
+    for m in config.get('maps', []):
+        try:
+            engine.set_action(*compile_map(m, ecodes.ecodes))
+        except ValueError as err:
+            print('warning: %s' % err, file=sys.stderr)
+    return engine
+
+
+def try_out(event, engine):
+    # when trying out, every key goes through the engine just like it would in
+    # remappy.py (so held modifiers and unmapped keys behave the same), and
+    # only keys without a mapping go on to be captured or prompted for
+    if engine.ui is None or event.type != ecodes.EV_KEY:
+        return False
+    mapped = engine.lookup(event.code) is not None
+    engine.handle(event)
+    return mapped
+
 
+def add_map(temp, config, engine):
+    # compile first so a broken map never makes it into the config
+    engine.set_action(*compile_map(temp, ecodes.ecodes))
+    set_map(temp, config)
 
-def add_to_config(event, config):
+
+def add_to_config(event, config, engine):
     if event.type == ecodes.EV_KEY:
         event = evdev.categorize(event)
         if event.keystate != 1:
@@ -116,19 +184,200 @@ def add_to_config(event, config):
             # didn't enter an option, so don't possibly overwrite something
             return
         temp['layer'] = layer_number
-        maps = config.get('maps', [])
-        for i, m in enumerate(maps):
-            if m.get('input', '') == temp['input'] and m.get('layer', 0) == temp['layer']:
-                maps[i] = temp
-                break
-        else:
-            maps.append(temp)
-        config['maps'] = maps
+        try:
+            add_map(temp, config, engine)
+        except ValueError as err:
+            print('error: %s' % err, file=sys.stderr)
+
+
+def set_map(temp, config):
+    maps = config.get('maps', [])
+    for i, m in enumerate(maps):
+        if m.get('input', '') == temp['input'] and m.get('layer', 0) == temp.get('layer', 0):
+            maps[i] = temp
+            break
+    else:
+        maps.append(temp)
+    config['maps'] = maps
 
 
-def save_config(config, fname='mappings/mappings.json'):
+def learn(devices, config, engine, batch=None, socket_path=None):
+    '''
+    Capture codes from every selected device at once. Nothing here blocks on
+    the terminal, so mappings come from a batch file or a control socket.
+    '''
+    capture = Capture()
+    fd_to_device = {dev.fd: dev for dev in devices}
+    server = open_control(socket_path) if socket_path else None
+    clients = {}
+
+    print('Learning, press each button you want to map (press ctrl-c to stop) ...')
+    try:
+        while True:
+            fds = list(fd_to_device) + list(clients)
+            if server is not None:
+                fds.append(server.fileno())
+            r, w, e = select.select(fds, [], [])
+
+            for fd in r:
+                if fd in fd_to_device:
+                    capture_events(fd_to_device[fd], capture, engine)
+                elif server is not None and fd == server.fileno():
+                    conn, addr = server.accept()
+                    # select says when to read, the timeout only bounds sending replies
+                    conn.settimeout(1)
+                    clients[conn.fileno()] = [conn, b'']
+                elif not read_control(clients, fd, capture, config, engine):
+                    return finish_learning(capture, config, engine, batch)
+    except KeyboardInterrupt:
+        return finish_learning(capture, config, engine, batch)
+    finally:
+        for conn, buf in clients.values():
+            conn.close()
+        if server is not None:
+            server.close()
+            os.unlink(socket_path)
+
+
+def capture_events(device, capture, engine):
+    try:
+        events = list(device.read())
+    except BlockingIOError:
+        return
+    for event in events:
+        if try_out(event, engine):
+            continue
+        if event.type != ecodes.EV_KEY or event.value != 1:
+            continue
+        entry = capture.add(device, event.code, event.timestamp())
+        warning = capture.check()
+        if warning is not None:
+            print('warning: %s' % warning, file=sys.stderr)
+        if entry is not None and capture.device() == device.path:
+            print('@%d: scancode %s on %s' % (len(capture.detected()), event.code, device.name))
+
+
+def open_control(socket_path):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+    server.setblocking(False)
+    print('Reading mapping definitions from %s' % socket_path)
+    return server
+
+
+def read_control(clients, fd, capture, config, engine):
+    # returns False when the client asked to stop learning
+    conn, buf = clients[fd]
+    try:
+        data = conn.recv(4096)
+    except BlockingIOError:
+        return True
+    except OSError:
+        data = b''
+    if not data:
+        drop_client(clients, fd)
+        return True
+    buf += data
+    *lines, buf = buf.split(b'\n')
+    clients[fd][1] = buf
+    for line in lines:
+        line = line.decode('utf-8', 'replace').strip()
+        if line == 'quit':
+            reply(clients, fd, 'ok')
+            return False
+        if not reply(clients, fd, control_command(line, capture, config, engine)):
+            break
+    return True
+
+
+def reply(clients, fd, msg):
+    # a client that went away (or stopped reading) is dropped, learning goes on
+    try:
+        clients[fd][0].sendall(msg.encode('utf-8') + b'\n')
+    except OSError:
+        drop_client(clients, fd)
+        return False
+    return True
+
+
+def drop_client(clients, fd):
+    conn, buf = clients.pop(fd)
+    conn.close()
+
+
+def control_command(line, capture, config, engine):
+    if line == 'list':
+        return capture.describe() or 'nothing captured yet'
+    elif line == 'save':
+        save_config(config, engine=engine)
+        return 'ok'
+    try:
+        apply_definition(line, capture, config, engine)
+    except ValueError as err:
+        return 'error: %s' % err
+    return 'ok'
+
+
+def apply_definition(line, capture, config, engine):
+    definition = parse_definition(line)
+    if definition is None:
+        return None
+    temp = make_map(definition, capture)
+    add_map(temp, config, engine)
+    print('mapped scancode %s in layer %s: %s' % (temp['input'], temp['layer'], line.strip()))
+    return temp
+
+
+def finish_learning(capture, config, engine, batch=None):
+    name = capture.device_name()
+    if name is not None:
+        config['name'] = name
+    if batch is None:
+        return 0
+    ret = 0
+    with open(batch, 'r') as f:
+        for num, line in enumerate(f, 1):
+            try:
+                apply_definition(line, capture, config, engine)
+            except ValueError as err:
+                print('error: %s:%d: %s' % (batch, num, err), file=sys.stderr)
+                ret = 1
+    return ret
+
+
+def save_config(config, fname='mappings/mappings.json', engine=None):
     with open(fname, 'w') as f:
         json.dump(config, f, sort_keys=True, indent=4)
+    if engine is None:
+        return
+    out_fname = compiled_name(fname)
+    if uncompiled(config, engine):
+        # leave compiling to parser.py, which will report the broken maps
+        print('warning: not saving %s, some maps did not compile' % out_fname, file=sys.stderr)
+        if os.path.exists(out_fname):
+            os.unlink(out_fname)
+        return
+    # the engine is already compiled, so parser.py won't have to
+    engine.tables.name = config.get('name', None)
+    save_tables(engine.tables, out_fname)
+
+
+def uncompiled(config, engine):
+    # maps in the config that never made it into the engine
+    missing = []
+    for m in config.get('maps', []):
+        try:
+            scancode = get_scancode(m.get('input', None), ecodes.ecodes)
+        except ValueError:
+            missing.append(m)
+            continue
+        layer = m.get('layer', 0)
+        if layer >= engine.tables.num_layers or scancode not in engine.tables.layer(layer):
+            missing.append(m)
+    return missing
 
 
 def select_devices(device_dir='/dev/input'):
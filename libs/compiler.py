@@ -0,0 +1,85 @@
+# turns a json config into the tables libs.engine runs from
+# only needed when a config changes, so the runtime never imports this
+
+
+import json
+
+from libs.store import ACTION_NONE, ACTION_KEYS, ACTION_LAYER, Tables, max_layer, save_tables
+from libs.macro_parser import Event_Converter, Map_Builder, Layer_Builder, Layer_Lexer, Short_Lexer, Macro_Lexer
+
+
+def default_codes():
+    from evdev import ecodes
+    return ecodes.ecodes
+
+
+def get_scancode(inp, codes):
+    # inputs are usually raw scancodes, but names like KEY_1 are allowed too
+    if isinstance(inp, str):
+        if inp.isdigit():
+            return int(inp)
+        if inp not in codes:
+            raise ValueError('unknown input %r' % inp)
+        return codes[inp]
+    return inp
+
+
+def compile_action(keymap, codes):
+    for k, v in keymap.items():
+        if k == 'short' or k == 'macro':
+            lexer = Short_Lexer(v) if k == 'short' else Macro_Lexer(v)
+            c = Event_Converter(Map_Builder(lexer), codes)
+            c.convert()
+            return (ACTION_KEYS, c.builder.keep, c.builder.touched, tuple(c.events))
+        elif k == 'set_layer':
+            lb = Layer_Builder(Layer_Lexer(v))
+            lb.build()
+            if lb.op is None:
+                return (ACTION_NONE,)
+            op, args = lb.op
+            if op == 'rotate' and not args:
+                raise ValueError('%r needs at least one layer' % v)
+            for arg in args:
+                if not 0 <= arg <= max_layer:
+                    raise ValueError('layer %d is out of range (0-%d)' % (arg, max_layer))
+            return (ACTION_LAYER, op, args)
+    return (ACTION_NONE,)
+
+
+def compile_map(keymap, codes=None):
+    '''
+    Compile a single map from the config, returns (layer, scancode, action).
+    Raises ValueError if the map can't be compiled.
+    '''
+    if codes is None:
+        codes = default_codes()
+    scancode = get_scancode(keymap.get('input', None), codes)
+    if not isinstance(scancode, int):
+        raise ValueError('map has no input: %r' % keymap)
+    layer = keymap.get('layer', 0)
+    if not isinstance(layer, int) or not 0 <= layer <= max_layer:
+        raise ValueError('bad layer %r for input %s' % (layer, keymap.get('input')))
+    try:
+        action = compile_action(keymap, codes)
+    except (IndexError, ValueError) as err:
+        raise ValueError('bad map for input %s: %s' % (keymap.get('input'), err))
+    return layer, scancode, action
+
+
+def compile_config(config, codes=None):
+    if codes is None:
+        codes = default_codes()
+    maps = config.get('maps', [])
+    # layers are added as maps need them, after compile_map has checked them
+    tables = Tables(config.get('name', None))
+    for m in maps:
+        tables.set_action(*compile_map(m, codes))
+    return tables
+
+
+def compile_file(config_file, out_fname):
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+    tables = compile_config(config)
+    save_tables(tables, out_fname)
+    return tables
@@ -0,0 +1,92 @@
+import re
+import sys
+
+from evdev import list_devices, InputDevice
+
+
+def select_device(device_dir='/dev/input'):
+    '''
+    Select a device from a list of accessible input devices.
+    '''
+
+    def devicenum(device_path):
+        digits = re.findall(r'\d+$', device_path)
+        return [int(i) for i in digits]
+
+    devices = sorted(list_devices(device_dir), key=devicenum)
+    devices = [InputDevice(path) for path in devices]
+    if not devices:
+        msg = 'error: no input devices found (do you have rw permission on %s/*?)'
+        print(msg % device_dir, file=sys.stderr)
+        sys.exit(1)
+
+    dev_format = '{0:<3} {1.path:<20} {1.name:<35} {1.phys:<35} {1.uniq:<4}'
+    dev_lines = [dev_format.format(num, dev) for num, dev in enumerate(devices)]
+
+    print('ID  {:<20} {:<35} {:<35} {}'.format('Device', 'Name', 'Phys', 'Uniq'))
+    print('-' * len(max(dev_lines, key=len)))
+    print('\n'.join(dev_lines))
+    print()
+
+    choice = input('Select devices [0-%s]: ' % (len(dev_lines) - 1))
+
+    try:
+        choice = choice.strip().split()
+        choice = [devices[int(num)] for num in choice]
+    except ValueError:
+        choice = None
+
+    if not choice:
+        msg = 'error: invalid input - please enter a number'
+        print(msg, file=sys.stderr)
+        sys.exit(1)
+
+    return choice[0]
+
+
+def get_device_by_name(name, device_dir='/dev/input'):
+    devices = [InputDevice(path) for path in list_devices(device_dir)]
+    dev = list(filter(lambda d: d.name == name, devices))
+    if len(dev) == 0:
+        return None
+    elif len(dev) > 1:
+        dev_format = '{0:<3} {1.path:<20} {1.name:<35} {1.phys:<35} {1.uniq:<4}'
+        dev_lines = [dev_format.format(num, d) for num, d in enumerate(dev)]
+
+        print('ID  {:<20} {:<35} {:<35} {}'.format('Device', 'Name', 'Phys', 'Uniq'))
+        print('-' * len(max(dev_lines, key=len)))
+        print('\n'.join(dev_lines))
+        print()
+
+        choices = input('Select device [0-%s]: ' % (len(dev_lines) - 1))
+
+        try:
+            choices = dev[int(choices.strip())]
+        except ValueError:
+            choices = None
+
+        if not choices:
+            msg = 'error: invalid input - please enter one or more numbers separated by spaces'
+            print(msg, file=sys.stderr)
+            sys.exit(1)
+
+        return choices
+    else:
+        # dev has just one element
+        return dev[0]
+
+
+def choose_device(name=None):
+    '''
+    Find the device a config was made for, falling back to asking the user.
+    '''
+    if name is None:
+        return select_device()
+    dev = get_device_by_name(name)
+    if dev is None:
+        return select_device()
+    print(f'Config uses {dev} is this ok [Y/N]?', end=' ')
+    cont = input().strip().lower()
+    if cont not in ['y', 'yes', '']:
+        return select_device()
+    return dev
@@ -0,0 +1,126 @@
+# the runtime half of remappy: loads compiled tables and turns device events
+# into virtual device events. this is imported on every launch, so keep it
+# free of evdev, json and the compiler
+
+
+from libs.layer import Layer
+from libs.modifiers import EV_KEY, Modifier_State
+from libs.store import ACTION_KEYS, ACTION_LAYER, RECORD, EVENT, ARG, layer_ops
+
+
+def compiled_name(config_file):
+    # mappings/mappings.json -> mappings/mappings.compiled
+    base = config_file[:-5] if config_file.endswith('.json') else config_file
+    return base + '.compiled'
+
+
+class Engine():
+    def __init__(self, tables, ui=None, echo=None):
+        # libs.store.Tables or Mapped_Tables
+        self.tables = tables
+        self.name = tables.name
+        self.current_layer = Layer(0, tables.num_layers - 1, 0)
+        # scancode -> action offset for the current layer
+        self.active = tables.layer(0)
+        self.mods = Modifier_State()
+        self.ui = ui
+        # scancode -> name lookup, echoes keys to the console when set
+        self.echo = echo
+
+    def lookup(self, scancode):
+        return self.active.get(scancode)
+
+    def set_action(self, layer, scancode, action):
+        self.tables.set_action(layer, scancode, action)
+        self.current_layer.max = self.tables.num_layers - 1
+        self.active = self.tables.layer(self.current_layer.layer)
+
+    def handle(self, event):
+        if event.type != EV_KEY:
+            return
+        code = event.code
+        value = event.value
+        if self.echo is not None and value == 1:
+            print(self.echo.get(code, code))
+        bit = self.mods.update(code, value)
+        action = self.lookup(code)
+        if action is None:
+            self.ui.write(EV_KEY, code, value)
+            self.ui.syn()
+            if bit:
+                self.mods.passthrough(bit, value)
+        elif value == 1:
+            try:
+                self.run_action(action)
+            except BaseException:
+                # don't leave anything stuck down if the action gets interrupted
+                self.mods.release_all(self.ui)
+                raise
+
+    def run_action(self, off):
+        # actions are read straight out of the tables' blob, see libs.store
+        blob = self.tables.blob
+        kind, arg, touched, count = RECORD.unpack_from(blob, off)
+        pos = off + RECORD.size
+        if kind == ACTION_KEYS:
+            ui = self.ui
+            self.mods.begin(ui, arg, touched)
+            for i in range(count):
+                code, value = EVENT.unpack_from(blob, pos)
+                ui.write(EV_KEY, code, value)
+                pos += EVENT.size
+            self.mods.end(ui)
+            ui.syn()
+        elif kind == ACTION_LAYER:
+            args = [ARG.unpack_from(blob, pos + i * ARG.size)[0] for i in range(count)]
+            op = layer_ops[arg]
+            if op == 'rotate':
+                self.current_layer.rotate(args)
+            else:
+                getattr(self.current_layer, op)(args[0])
+            self.active = self.tables.layer(self.current_layer.layer)
+
+    def run(self, device):
+        try:
+            for event in device.read_loop():
+                self.handle(event)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.ui is not None:
+            self.mods.release_all(self.ui)
+            self.ui.close()
+            self.ui = None
+        self.tables.close()
+
+
+class Fake_UInput():
+    '''
+    Stands in for evdev.UInput when trying out mappings, printing each report
+    instead of sending it anywhere.
+    '''
+    def __init__(self, names=None):
+        # scancode -> name, only used for printing
+        self.names = {} if names is None else names
+        self.events = []
+
+    def write(self, etype, code, value):
+        self.events.append((etype, code, value))
+
+    def write_event(self, event):
+        self.write(event.type, event.code, event.value)
+
+    def syn(self):
+        if self.events:
+            print(' '.join(self.describe(code, value) for etype, code, value in self.events))
+        self.events = []
+
+    def describe(self, code, value):
+        name = self.names.get(code, code)
+        if isinstance(name, list):
+            name = name[0]
+        return '%s%s' % (name, {0: '-', 1: '+'}.get(value, '*'))
+
+    def close(self):
+        self.syn()
@@ -0,0 +1,151 @@
+# learn mode for config_builder: captures codes from the devices while the
+# mappings themselves come in from a batch file or a control socket
+
+
+modes = {
+    's': 'short',
+    'short': 'short',
+    'm': 'macro',
+    'macro': 'macro',
+    'l': 'set_layer',
+    'layer': 'set_layer',
+    'set_layer': 'set_layer'
+}
+
+
+class Capture():
+    '''
+    Codes pressed on the selected devices, de-duplicated and kept in the order
+    they were first seen.
+    '''
+    def __init__(self):
+        self.codes = []
+        self.seen = {}
+        # once a definition has used @N, @N always means this device
+        self.locked = None
+        # the device detected the last time check() was called
+        self.shown = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return iter(self.codes)
+
+    def add(self, device, scancode, timestamp):
+        # returns the entry if this is the first time the code was seen
+        key = (device.path, scancode)
+        entry = self.seen.get(key, None)
+        if entry is not None:
+            entry['last'] = timestamp
+            entry['count'] += 1
+            return None
+        entry = {
+            'device': device.path,
+            'name': device.name,
+            'scancode': scancode,
+            'first': timestamp,
+            'last': timestamp,
+            'count': 1
+        }
+        self.seen[key] = entry
+        self.codes.append(entry)
+        return entry
+
+    def detect(self):
+        # the device being mapped is whichever one has been pressed the most
+        counts = {}
+        for entry in self.codes:
+            counts[entry['device']] = counts.get(entry['device'], 0) + entry['count']
+        if not counts:
+            return None
+        return max(counts, key=counts.get)
+
+    def device(self):
+        return self.locked if self.locked is not None else self.detect()
+
+    def lock(self):
+        if self.locked is None:
+            self.locked = self.detect()
+
+    def check(self):
+        '''
+        Returns a warning if the detected device changed since the last check,
+        so that @N refers to a different device (or would, if not locked).
+        '''
+        detected = self.detect()
+        previous = self.shown
+        self.shown = detected
+        if previous is None or detected == previous:
+            return None
+        if self.locked is not None:
+            if detected == self.locked:
+                return None
+            return '%s is being pressed the most, but @N still refers to %s' % (
+                self.name_of(detected), self.name_of(self.locked))
+        return 'now mapping %s instead of %s, @N refers to its codes from here on' % (
+            self.name_of(detected), self.name_of(previous))
+
+    def name_of(self, path):
+        for entry in self.codes:
+            if entry['device'] == path:
+                return entry['name']
+        return None
+
+    def device_name(self):
+        return self.name_of(self.device())
+
+    def detected(self):
+        path = self.device()
+        return [entry for entry in self.codes if entry['device'] == path]
+
+    def resolve(self, target):
+        # '@3' is the third code captured on the detected device, anything
+        # else is taken as a scancode or key name
+        if target.startswith('@'):
+            try:
+                n = int(target[1:])
+            except ValueError:
+                raise ValueError('bad capture reference %r' % target)
+            codes = self.detected()
+            if n < 1 or n > len(codes):
+                raise ValueError('%s has not been captured yet (%d codes so far)' % (target, len(codes)))
+            self.lock()
+            return codes[n - 1]['scancode']
+        elif target.isdigit():
+            return int(target)
+        return target
+
+    def describe(self):
+        lines = []
+        for n, entry in enumerate(self.detected(), 1):
+            lines.append('@{:<3} scancode {:<5} pressed {:<3} first {:.3f} last {:.3f}'.format(
+                n, entry['scancode'], entry['count'], entry['first'], entry['last']))
+        return '\n'.join(lines)
+
+
+def parse_definition(line):
+    '''
+    Parse a mapping definition of the form '<target> <layer> <mode> <value>',
+    e.g. '@1 0 m \\Shello' or '276 1 l alt 0 1'. Returns None for blank lines
+    and comments.
+    '''
+    line = line.strip()
+    if line == '' or line.startswith('#'):
+        return None
+    parts = line.split(None, 3)
+    if len(parts) < 4:
+        raise ValueError('expected <target> <layer> <mode> <value>, got %r' % line)
+    target, layer, mode, value = parts
+    try:
+        layer = int(layer)
+    except ValueError:
+        raise ValueError('bad layer %r' % layer)
+    if mode.lower() not in modes:
+        raise ValueError('bad mode %r, expected s, m or l' % mode)
+    return target, layer, modes[mode.lower()], value
+
+
+def make_map(definition, capture):
+    target, layer, mode, value = definition
+    return {'input': capture.resolve(target), 'layer': layer, mode: value}
@@ -10,8 +10,9 @@
 
 import re
 
+from libs.modifiers import mod_bits
+
 
-names = {'uinput': 'ui', 'ecodes': 'e'}
 mod_converter = {
     'ctrl': 'LEFTCTRL',
     'lctrl': 'LEFTCTRL',
@@ -114,6 +115,9 @@ class Map_Builder():
         self.lexer = lexer
         self.commands = []
         self.mod_keys = mod_keys
+        # modifiers held for the whole action and modifiers it touches at all
+        self.keep = 0
+        self.touched = 0
 
     def __repr__(self):
         return str(self.commands)
@@ -132,105 +136,101 @@ class Map_Builder():
 
     def build(self):
         mods = []
-        self.mod_keys
+        mask = 0
+        keep = None
         for token in self.lexer:
-            if token in mod_keys:
+            if token in self.mod_keys:
+                bit = mod_bits[mod_converter[token.lower()]]
+                mask |= bit
+                self.touched |= bit
                 self.commands.append((token, 'down'))
                 mods.append((token, 'up'))
             else:
+                keep = mask if keep is None else keep & mask
+                mask = 0
                 self.commands.append((token, 'down'))
                 self.commands.append((token, 'up'))
                 while len(mods) > 0:
                     self.commands.append(mods.pop())
         while len(mods) > 0:
             self.commands.append(mods.pop())
+        self.keep = keep or 0
 
 
 class Layer_Builder():
     def __init__(self, lexer):
         self.lexer = lexer
-        self.commands = []
+        # (method on Layer, args) for the compiled tables
+        self.op = None
 
     def __repr__(self):
-        return str(self.commands)
-
-    def __iter__(self):
-        self.i = 0
-        return self
-
-    def __next__(self):
-        if self.i < len(self.commands):
-            result = self.commands[self.i]
-            self.i += 1
-            return result
-        else:
-            raise StopIteration
+        return str(self.op)
 
     def build(self):
         tokens = list(self.lexer)
         cmd = tokens[0]
-        self.commands.append('global current_layer')
         if cmd == 'inc':
-            self.commands.append('current_layer.inc(%s)' % tokens[1])
+            self.op = ('inc', (int(tokens[1]),))
         elif cmd == 'dec':
-            self.commands.append('current_layer.dec(%s)' % tokens[1])
+            self.op = ('dec', (int(tokens[1]),))
         elif cmd == 'set':
-            self.commands.append('current_layer.set(%s)' % tokens[1])
-        elif cmd == 'alt' or cmd == 'rot':
-            self.commands.append('layers = %s' % ('[' + ', '.join(tokens[1:]) + ']'))
-            self.commands.append('current_layer.rotate(layers)')
+            self.op = ('set', (int(tokens[1]),))
+        elif cmd in ('alt', 'rot', 'rotate'):
+            self.op = ('rotate', tuple(int(t) for t in tokens[1:]))
         else:
-            self.commands.append('pass')
+            self.op = None
 
 
-class Converter():
-    def __init__(self, builder, names=names, mod_keys=mod_keys, mod_converter=mod_converter):
+class Event_Converter():
+    '''
+    Resolves each key the builder presses or releases to its scancode, giving
+    a list of (scancode, value) events for the compiled tables.
+    '''
+    def __init__(self, builder, codes, mod_keys=mod_keys, mod_converter=mod_converter):
         self.builder = builder
-        self.commands = []
-        self.uinput_name = names.get('uinput', 'ui')
-        self.ecodes_name = names.get('ecodes', 'e')
+        self.codes = codes
+        self.events = []
         self.mod_keys = mod_keys
         self.mod_converter = mod_converter
 
     def __repr__(self):
-        return '\n'.join(self.commands)
+        return str(self.events)
 
     def __iter__(self):
         self.i = 0
         return self
 
     def __next__(self):
-        if self.i < len(self.commands):
-            result = self.commands[self.i]
+        if self.i < len(self.events):
+            result = self.events[self.i]
             self.i += 1
             return result
         else:
             raise StopIteration
 
+    def key_name(self, token):
+        if token.lower() in self.mod_keys:
+            return self.mod_converter.get(token.lower())
+        elif token.lower() in special_keys:
+            return special_converter.get(token.lower())
+        else:
+            return token.upper()
+
     def convert(self):
         self.builder.build()
         for c in self.builder:
-            cmd_string = self.uinput_name + '.write(' + self.ecodes_name + '.EV_KEY, ' + self.ecodes_name + '.KEY_'
-            if c[0].lower() in mod_keys:
-                cmd_string += mod_converter.get(c[0].lower())
-            elif c[0].lower() in special_keys:
-                cmd_string += special_converter.get(c[0].lower())
-            else:
-                cmd_string += c[0].upper()
-            cmd_string += ', '
-            if c[1] == 'down':
-                cmd_string += '1'
-            elif c[1] == 'up':
-                cmd_string += '0'
-            cmd_string += ')'
-            self.commands.append(cmd_string)
+            name = 'KEY_' + self.key_name(c[0])
+            if name not in self.codes:
+                raise ValueError('unknown key %r' % c[0])
+            self.events.append((self.codes[name], 1 if c[1] == 'down' else 0))
 
 
+# from evdev import ecodes
 # ml = Macro_Lexer('al\\A\\Cpha\\Sbet\\Ma')
 # ml = Macro_Lexer('\\Cc')
 # ml = Short_Lexer('ctrl+rshift+c')
 # mb = Map_Builder(ml, mod_keys)
-# c = Converter(mb, names, mod_keys, mod_converter)
+# c = Event_Converter(mb, ecodes.ecodes, mod_keys, mod_converter)
 # c.convert()
 # print(c)
 # with open('test.txt', 'r') as f:
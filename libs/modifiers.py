@@ -0,0 +1,96 @@
+# modifier state is kept as a bitmap, one bit per modifier key
+# scancodes come from linux/input-event-codes.h so that this module
+# doesn't need to import evdev
+
+
+EV_KEY = 1
+
+mod_bits = {
+    'LEFTCTRL': 1 << 0,
+    'LEFTSHIFT': 1 << 1,
+    'LEFTALT': 1 << 2,
+    'LEFTMETA': 1 << 3,
+    'RIGHTCTRL': 1 << 4,
+    'RIGHTSHIFT': 1 << 5,
+    'RIGHTALT': 1 << 6,
+    'RIGHTMETA': 1 << 7
+}
+mod_codes = {
+    'LEFTCTRL': 29,
+    'LEFTSHIFT': 42,
+    'LEFTALT': 56,
+    'LEFTMETA': 125,
+    'RIGHTCTRL': 97,
+    'RIGHTSHIFT': 54,
+    'RIGHTALT': 100,
+    'RIGHTMETA': 126
+}
+all_mods = (1 << len(mod_bits)) - 1
+
+# scancode -> bit, used when tracking incoming events
+code_bits = {mod_codes[name]: bit for name, bit in mod_bits.items()}
+
+
+def _codes_for(mask):
+    return tuple(mod_codes[name] for name, bit in mod_bits.items() if mask & bit)
+
+
+# every possible mask maps to the scancodes it contains, built once so that
+# neutralizing and restoring never has to allocate
+mask_codes = tuple(_codes_for(mask) for mask in range(all_mods + 1))
+
+
+class Modifier_State():
+    '''
+    Tracks which modifiers are physically held on a device and which ones the
+    virtual device currently has pressed.
+    '''
+    __slots__ = ('physical', 'virtual', 'held')
+
+    def __init__(self):
+        self.physical = 0
+        self.virtual = 0
+        # what the virtual device had pressed when the current action started
+        self.held = 0
+
+    def __repr__(self):
+        return 'Modifier_State(physical={:#04x}, virtual={:#04x})'.format(self.physical, self.virtual)
+
+    def update(self, code, value):
+        # record a physical key change, returns the modifier bit (0 if not a modifier)
+        bit = code_bits.get(code, 0)
+        if bit:
+            if value:
+                self.physical |= bit
+            else:
+                self.physical &= ~bit
+        return bit
+
+    def passthrough(self, bit, value):
+        # an event was forwarded to the virtual device unchanged
+        if value:
+            self.virtual |= bit
+        else:
+            self.virtual &= ~bit
+
+    def begin(self, ui, keep, touched):
+        # release everything the action doesn't want held, then assume the
+        # worst about what it touches so an interrupted action gets cleaned up
+        self.held = self.virtual
+        for code in mask_codes[self.virtual & ~keep]:
+            ui.write(EV_KEY, code, 0)
+        self.virtual = (self.virtual & keep) | touched
+
+    def end(self, ui):
+        # actions always leave their own modifiers released, so whatever was
+        # held going in and is still physically down has to be pressed again
+        restore = self.held & self.physical
+        for code in mask_codes[restore]:
+            ui.write(EV_KEY, code, 1)
+        self.virtual = restore
+
+    def release_all(self, ui):
+        for code in mask_codes[self.virtual]:
+            ui.write(EV_KEY, code, 0)
+        self.virtual = 0
+        ui.syn()
@@ -0,0 +1,243 @@
+# compiled mapping tables, in memory while building and memory-mapped at runtime
+#
+# file layout, all little endian, offsets are from the start of the file:
+#   header      magic, version, number of layers, length of the device name
+#   name        utf-8, padded to 4 bytes
+#   directory   (index offset, number of entries) for every layer
+#   indexes     (scancode, action offset) for every map, sorted per layer
+#   blob        action records shared by all layers, identical ones stored once
+#
+# an action record is (kind, keep or layer op, touched, count) followed by
+# count (scancode, value) events for key actions or count layer numbers for
+# layer actions
+
+
+import os
+import mmap
+import struct
+
+
+MAGIC = b'RMPY'
+FORMAT_VERSION = 1
+
+ACTION_NONE = 0
+ACTION_KEYS = 1
+ACTION_LAYER = 2
+
+layer_ops = ('inc', 'dec', 'set', 'rotate')
+# the header counts layers in 16 bits, so the last layer is one less than that
+max_layer = 0xFFFE
+
+HEADER = struct.Struct('<4sHHI')
+DIRECTORY = struct.Struct('<II')
+INDEX = struct.Struct('<II')
+RECORD = struct.Struct('<BBBxI')
+EVENT = struct.Struct('<HH')
+ARG = struct.Struct('<H')
+
+
+def encode_action(action):
+    # action tuples come from libs.compiler
+    kind = action[0]
+    if kind == ACTION_KEYS:
+        kind, keep, touched, events = action
+        out = bytearray(RECORD.pack(kind, keep, touched, len(events)))
+        for code, value in events:
+            out += EVENT.pack(code, value)
+        return bytes(out)
+    elif kind == ACTION_LAYER:
+        kind, op, args = action
+        out = bytearray(RECORD.pack(kind, layer_ops.index(op), 0, len(args)))
+        for arg in args:
+            out += ARG.pack(arg)
+        return bytes(out)
+    return RECORD.pack(ACTION_NONE, 0, 0, 0)
+
+
+def record_size(blob, off):
+    kind, arg, touched, count = RECORD.unpack_from(blob, off)
+    if kind == ACTION_KEYS:
+        return RECORD.size + count * EVENT.size
+    elif kind == ACTION_LAYER:
+        return RECORD.size + count * ARG.size
+    return RECORD.size
+
+
+def decode_action(blob, off):
+    # the inverse of encode_action, handy for inspecting a compiled file
+    kind, arg, touched, count = RECORD.unpack_from(blob, off)
+    pos = off + RECORD.size
+    if kind == ACTION_KEYS:
+        events = tuple(EVENT.unpack_from(blob, pos + i * EVENT.size) for i in range(count))
+        return (kind, arg, touched, events)
+    elif kind == ACTION_LAYER:
+        args = tuple(ARG.unpack_from(blob, pos + i * ARG.size)[0] for i in range(count))
+        return (kind, layer_ops[arg], args)
+    return (ACTION_NONE,)
+
+
+class Tables():
+    '''
+    Mapping tables held in memory, used while compiling and by the config
+    builder. Every layer maps scancode -> offset of its action in blob.
+    '''
+    def __init__(self, name=None, num_layers=1):
+        self.name = name
+        self.layers = [{} for i in range(num_layers)]
+        self.blob = bytearray()
+
+    @property
+    def num_layers(self):
+        return len(self.layers)
+
+    def layer(self, n):
+        return self.layers[n]
+
+    def set_action(self, layer, scancode, action):
+        # replaced actions are left in the blob until the tables are saved
+        highest = layer
+        if action[0] == ACTION_LAYER and action[1] in ('set', 'rotate'):
+            # layers that are only switched to still need a (maybe empty) table
+            highest = max((highest,) + tuple(action[2]))
+        while len(self.layers) <= highest:
+            self.layers.append({})
+        self.layers[layer][scancode] = len(self.blob)
+        self.blob += encode_action(action)
+
+    def close(self):
+        pass
+
+
+class Mapped_Layer():
+    '''
+    One layer's sorted (scancode, action offset) index, binary searched where
+    it sits in the mapping instead of being copied out.
+    '''
+    __slots__ = ('blob', 'start', 'count', 'size')
+
+    def __init__(self, blob, start, count):
+        self.blob = blob
+        self.start = start
+        self.count = count
+        self.size = len(blob)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, scancode):
+        return self.get(scancode) is not None
+
+    def get(self, scancode, default=None):
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            code, off = INDEX.unpack_from(self.blob, self.start + mid * INDEX.size)
+            if code < scancode:
+                lo = mid + 1
+            elif code > scancode:
+                hi = mid
+            else:
+                # the engine trusts whatever this returns, so check it's all there
+                if off + RECORD.size > self.size or off + record_size(self.blob, off) > self.size:
+                    raise ValueError('action for scancode %d is outside the file' % scancode)
+                return off
+        return default
+
+    def items(self):
+        for i in range(self.count):
+            yield INDEX.unpack_from(self.blob, self.start + i * INDEX.size)
+
+
+class Mapped_Tables():
+    '''
+    Mapping tables read straight out of a memory-mapped compiled file. Nothing
+    about a layer is read until the first time it is used, and both the layer
+    indexes and the actions are read from the mapping as they are needed, so
+    memory use doesn't grow with the size of the config.
+    '''
+    def __init__(self, fname):
+        with open(fname, 'rb') as f:
+            try:
+                self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError('%s is empty' % fname)
+        try:
+            magic, version, num_layers, name_len = HEADER.unpack_from(self.blob, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError('%s was compiled by a different version of remappy' % fname)
+            name = self.blob[HEADER.size:HEADER.size + name_len]
+            self.name = name.decode('utf-8') if name_len else None
+            self.directory = HEADER.size + _pad(name_len)
+            # check the directory is all there before anything relies on it
+            DIRECTORY.unpack_from(self.blob, self.directory + max(num_layers - 1, 0) * DIRECTORY.size)
+        except struct.error:
+            self.blob.close()
+            raise ValueError('%s is truncated' % fname)
+        except ValueError:
+            self.blob.close()
+            raise
+        self.num_layers = num_layers
+        self.layers = [None] * num_layers
+
+    def layer(self, n):
+        table = self.layers[n]
+        if table is None:
+            off, count = DIRECTORY.unpack_from(self.blob, self.directory + n * DIRECTORY.size)
+            if off + count * INDEX.size > len(self.blob):
+                raise ValueError('index for layer %d is truncated' % n)
+            table = Mapped_Layer(self.blob, off, count)
+            self.layers[n] = table
+        return table
+
+    def close(self):
+        self.layers = [None] * self.num_layers
+        self.blob.close()
+
+
+def _pad(n):
+    return (n + 3) & ~3
+
+
+def load_tables(fname):
+    return Mapped_Tables(fname)
+
+
+def save_tables(tables, fname):
+    name = b'' if tables.name is None else tables.name.encode('utf-8')
+    num_layers = tables.num_layers
+    layers = [sorted(tables.layer(n).items()) for n in range(num_layers)]
+
+    index_start = HEADER.size + _pad(len(name)) + num_layers * DIRECTORY.size
+    blob_start = index_start + sum(len(layer) for layer in layers) * INDEX.size
+
+    # copy every action into the shared blob once, however many maps use it
+    blob = bytearray()
+    offsets = {}
+    records = {}
+    for layer in layers:
+        for scancode, off in layer:
+            if off in offsets:
+                continue
+            record = bytes(tables.blob[off:off + record_size(tables.blob, off)])
+            if record not in records:
+                records[record] = blob_start + len(blob)
+                blob += record
+            offsets[off] = records[record]
+
+    out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, num_layers, len(name)))
+    out += name.ljust(_pad(len(name)), b'\0')
+    off = index_start
+    for layer in layers:
+        out += DIRECTORY.pack(off, len(layer))
+        off += len(layer) * INDEX.size
+    for layer in layers:
+        for scancode, action in layer:
+            out += INDEX.pack(scancode, offsets[action])
+    out += blob
+
+    # the runtime may have the old file mapped, so never rewrite it in place
+    tmp = fname + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(out)
+    os.replace(tmp, fname)
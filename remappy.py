@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+'''
+Usage: remappy.py [-q] [<compiled_file>]
+
+Run remappy from a compiled mapping file. parser.py compiles configs and then
+starts this, so you only need to run it directly to skip the compile check.
+
+Options:
+  -h, --help   Show this help message and exit.
+  -q, --quiet  Don't echo keys to the console.
+'''
+
+
+import sys
+
+from libs.engine import Engine, compiled_name
+from libs.store import load_tables
+
+
+default_config = 'mappings/mappings.json'
+
+
+def load(fname):
+    return Engine(load_tables(fname))
+
+
+def main(argv=None):
+    # deliberately no docopt here, startup time matters on small machines
+    args = sys.argv[1:] if argv is None else argv
+    if '-h' in args or '--help' in args:
+        print(__doc__.strip())
+        return 0
+    quiet = '-q' in args or '--quiet' in args
+    args = [a for a in args if not a.startswith('-')]
+    fname = args[0] if args else compiled_name(default_config)
+
+    try:
+        engine = load(fname)
+    except (OSError, ValueError, EOFError) as err:
+        print('error: could not load %s (%s), run parser.py to compile your config' % (fname, err), file=sys.stderr)
+        return 1
+
+    from evdev import UInput, ecodes
+    from libs.devices import choose_device
+
+    dev = choose_device(engine.name)
+    dev.grab()
+    print(dev)
+    engine.ui = UInput()
+    if not quiet:
+        engine.echo = ecodes.KEY
+    engine.run(dev)
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        ret = main()
+    except (KeyboardInterrupt, EOFError):
+        ret = 0
+    sys.exit(ret)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+'''
+Usage: startup_bench.py [options] [<config_file>]
+
+Measures how long remappy.py takes to get from launch to ready to read events,
+and how much memory it is holding by then. Exits non-zero when either budget
+is exceeded.
+
+Options:
+  -h, --help            Show this help message and exit.
+  -n, --runs=<n>        Number of launches to take the median of [default: 10].
+  -t, --time=<ms>       Startup budget in milliseconds [default: 200].
+  -m, --rss=<kb>        Peak resident memory budget in KiB [default: 32768].
+  -s, --synthetic=<n>   Benchmark a generated config with n large macros
+                        spread over several layers instead of a real one.
+'''
+
+
+import os
+import sys
+import json
+import time
+import tempfile
+import optparse
+import statistics
+import subprocess
+
+
+# everything remappy.py does before it opens a device. ru_maxrss survives
+# exec on linux, so it would include the benchmark itself, use VmHWM there
+startup = '''
+import resource, sys
+import evdev
+import remappy
+remappy.load(sys.argv[1])
+try:
+    with open('/proc/self/status') as f:
+        print([line.split()[1] for line in f if line.startswith('VmHWM:')][0])
+except (OSError, IndexError):
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def parseopt():
+    parser = optparse.OptionParser(add_help_option=False)
+    parser.add_option('-h', '--help', action='store_true')
+    parser.add_option('-n', '--runs', type='int', default=10)
+    parser.add_option('-t', '--time', type='float', default=200)
+    parser.add_option('-m', '--rss', type='int', default=32768)
+    parser.add_option('-s', '--synthetic', type='int')
+    return parser.parse_args()
+
+
+def synthetic_config(n, macro_len=2000, per_layer=200):
+    # remappy should use about the same memory however big this gets
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    maps = []
+    for i in range(n):
+        macro = str(i) + ''.join(letters[(i + j) % len(letters)] for j in range(macro_len))
+        maps.append({'input': 2 + i % per_layer, 'layer': i // per_layer, 'macro': macro})
+    return {'maps': maps}
+
+
+def measure(compiled, runs):
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    rss = []
+    for i in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', startup, compiled], cwd=here,
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True)
+        times.append((time.perf_counter() - start) * 1000)
+        rss.append(int(out.stdout.split()[-1]))
+    return statistics.median(times), max(rss)
+
+
+def main():
+    opts, args = parseopt()
+    if opts.help:
+        print(__doc__.strip())
+        return 0
+    config_file = args[0] if args else 'mappings/mappings.json'
+
+    from libs.compiler import compile_file
+    with tempfile.TemporaryDirectory() as tmp:
+        if opts.synthetic:
+            config_file = os.path.join(tmp, 'bench.json')
+            with open(config_file, 'w') as f:
+                json.dump(synthetic_config(opts.synthetic), f)
+        compiled = os.path.join(tmp, 'bench.compiled')
+        compile_file(config_file, compiled)
+        print('{}: {} KiB compiled'.format(config_file, os.path.getsize(compiled) // 1024))
+        ms, kb = measure(compiled, opts.runs)
+
+    ok = True
+    print('startup: {:.1f} ms (budget {:.0f} ms)'.format(ms, opts.time))
+    if ms > opts.time:
+        print('error: startup time over budget', file=sys.stderr)
+        ok = False
+    print('peak rss: {} KiB (budget {} KiB)'.format(kb, opts.rss))
+    if kb > opts.rss:
+        print('error: resident memory over budget', file=sys.stderr)
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import unittest
+
+from libs.compiler import compile_map, compile_config
+from libs.store import ACTION_LAYER
+
+
+codes = {'KEY_A': 30}
+
+
+class Compile_Map_Test(unittest.TestCase):
+    def test_layer_actions(self):
+        self.assertEqual(compile_map({'input': 2, 'set_layer': 'rotate 0 3'}, codes), (0, 2, (ACTION_LAYER, 'rotate', (0, 3))))
+        self.assertEqual(compile_map({'input': 2, 'set_layer': 'inc 1'}, codes)[2], (ACTION_LAYER, 'inc', (1,)))
+
+    def test_bad_layer_actions(self):
+        for cmd in ['alt', 'rot', 'rotate', 'set -1', 'set 70000', 'rotate -1 0', 'inc x', 'set']:
+            with self.assertRaises(ValueError, msg=cmd):
+                compile_map({'input': 2, 'set_layer': cmd}, codes)
+
+    def test_bad_map_layer(self):
+        for layer in [-1, 70000, '1']:
+            with self.assertRaises(ValueError, msg=layer):
+                compile_map({'input': 2, 'layer': layer, 'short': 'a'}, codes)
+
+    def test_unknown_key(self):
+        with self.assertRaises(ValueError):
+            compile_map({'input': 2, 'macro': 'a,b'}, codes)
+
+    def test_rotate_target_gets_a_layer(self):
+        tables = compile_config({'maps': [{'input': 2, 'set_layer': 'rotate 0 3'}]}, codes)
+        self.assertEqual(tables.num_layers, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+
+from libs.learn import Capture, parse_definition, make_map
+
+
+class Device():
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+
+
+mouse = Device('/dev/input/event5', 'Mouse')
+keyboard = Device('/dev/input/event2', 'Keyboard')
+
+
+class Capture_Test(unittest.TestCase):
+    def test_add_dedups_and_keeps_timestamps(self):
+        capture = Capture()
+        self.assertIsNotNone(capture.add(mouse, 275, 1.0))
+        self.assertIsNotNone(capture.add(mouse, 276, 2.0))
+        self.assertIsNone(capture.add(mouse, 275, 3.0))
+        self.assertEqual(len(capture), 2)
+        entry = capture.codes[0]
+        self.assertEqual((entry['scancode'], entry['first'], entry['last'], entry['count']), (275, 1.0, 3.0, 2))
+
+    def test_same_code_on_two_devices(self):
+        capture = Capture()
+        capture.add(mouse, 30, 1.0)
+        self.assertIsNotNone(capture.add(keyboard, 30, 2.0))
+        self.assertEqual(len(capture), 2)
+
+    def test_resolve(self):
+        capture = Capture()
+        capture.add(mouse, 275, 1.0)
+        capture.add(mouse, 276, 2.0)
+        self.assertEqual(capture.resolve('@2'), 276)
+        self.assertEqual(capture.resolve('30'), 30)
+        self.assertEqual(capture.resolve('KEY_A'), 'KEY_A')
+        for target in ['@0', '@3', '@x']:
+            with self.assertRaises(ValueError, msg=target):
+                capture.resolve(target)
+
+    def test_device_is_locked_once_used(self):
+        capture = Capture()
+        capture.add(mouse, 275, 1.0)
+        capture.add(mouse, 276, 2.0)
+        capture.check()
+        self.assertEqual(capture.resolve('@1'), 275)
+        for code in [30, 31, 32, 33]:
+            capture.add(keyboard, code, 3.0)
+        self.assertIsNotNone(capture.check())
+        self.assertEqual(capture.resolve('@1'), 275)
+        self.assertEqual(capture.device_name(), 'Mouse')
+
+    def test_warns_when_detection_changes(self):
+        capture = Capture()
+        capture.add(mouse, 275, 1.0)
+        self.assertIsNone(capture.check())
+        capture.add(keyboard, 30, 2.0)
+        capture.add(keyboard, 31, 3.0)
+        self.assertIsNotNone(capture.check())
+        self.assertIsNone(capture.check())
+        self.assertEqual(capture.device(), keyboard.path)
+
+
+class Definition_Test(unittest.TestCase):
+    def test_modes(self):
+        for mode, key in [('s', 'short'), ('short', 'short'), ('M', 'macro'), ('l', 'set_layer'), ('layer', 'set_layer')]:
+            self.assertEqual(parse_definition('@1 0 %s x' % mode)[2], key)
+
+    def test_value_keeps_spaces(self):
+        self.assertEqual(parse_definition('276 1 l alt 0 1'), ('276', 1, 'set_layer', 'alt 0 1'))
+
+    def test_blank_and_comments(self):
+        self.assertIsNone(parse_definition('   '))
+        self.assertIsNone(parse_definition('# @1 0 s a'))
+
+    def test_bad_definitions(self):
+        for line in ['@1 0 s', '@1 x s a', '@1 0 q a']:
+            with self.assertRaises(ValueError, msg=line):
+                parse_definition(line)
+
+    def test_make_map(self):
+        capture = Capture()
+        capture.add(mouse, 275, 1.0)
+        self.assertEqual(make_map(parse_definition('@1 2 s ctrl+c'), capture), {'input': 275, 'layer': 2, 'short': 'ctrl+c'})
+
+
+if __name__ == '__main__':
+    unittest.main()
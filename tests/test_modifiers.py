@@ -0,0 +1,119 @@
+import unittest
+
+from libs.compiler import compile_config
+from libs.engine import Engine
+from libs.macro_parser import Map_Builder, Short_Lexer, Macro_Lexer
+from libs.modifiers import Modifier_State, mod_bits
+
+
+codes = {
+    'KEY_LEFTCTRL': 29,
+    'KEY_LEFTSHIFT': 42,
+    'KEY_C': 46
+}
+
+LEFTCTRL = 29
+LEFTSHIFT = 42
+CTRL = mod_bits['LEFTCTRL']
+SHIFT = mod_bits['LEFTSHIFT']
+
+
+class Recorder():
+    def __init__(self):
+        self.events = []
+
+    def write(self, etype, code, value):
+        self.events.append((code, value))
+
+    def syn(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Event():
+    def __init__(self, code, value):
+        self.type = 1
+        self.code = code
+        self.value = value
+
+
+def build(lexer):
+    mb = Map_Builder(lexer)
+    mb.build()
+    return mb
+
+
+class Map_Builder_Test(unittest.TestCase):
+    def test_chord(self):
+        mb = build(Short_Lexer('ctrl+c'))
+        self.assertEqual((mb.keep, mb.touched), (CTRL, CTRL))
+
+    def test_two_modifiers(self):
+        mb = build(Short_Lexer('ctrl+shift+c'))
+        self.assertEqual((mb.keep, mb.touched), (CTRL | SHIFT, CTRL | SHIFT))
+
+    def test_macro_shift_on_one_key(self):
+        # shift only applies to the 'a', so it can't stay held for the whole macro
+        mb = build(Macro_Lexer('\\Sab'))
+        self.assertEqual((mb.keep, mb.touched), (0, SHIFT))
+
+    def test_modifier_only(self):
+        mb = build(Short_Lexer('ctrl'))
+        self.assertEqual((mb.keep, mb.touched), (0, CTRL))
+
+    def test_plain_key(self):
+        mb = build(Short_Lexer('c'))
+        self.assertEqual((mb.keep, mb.touched), (0, 0))
+
+
+class Modifier_Test(unittest.TestCase):
+    def held(self, code):
+        # a modifier pressed on the device and passed through
+        mods = Modifier_State()
+        mods.passthrough(mods.update(code, 1), 1)
+        return mods
+
+    def test_shift_held(self):
+        # \Shi with shift held: shift is let go for the 'i' and pressed again after
+        mods = self.held(LEFTSHIFT)
+        ui = Recorder()
+        mods.begin(ui, 0, SHIFT)
+        mods.end(ui)
+        self.assertEqual(ui.events, [(LEFTSHIFT, 0), (LEFTSHIFT, 1)])
+        self.assertEqual(mods.virtual, mods.physical)
+
+    def test_ctrl_held(self):
+        # ctrl+c with ctrl held: ctrl is kept for the action, then restored
+        mods = self.held(LEFTCTRL)
+        ui = Recorder()
+        mods.begin(ui, CTRL, CTRL)
+        mods.end(ui)
+        self.assertEqual(ui.events, [(LEFTCTRL, 1)])
+
+    def test_released_during_action(self):
+        mods = self.held(LEFTSHIFT)
+        ui = Recorder()
+        mods.begin(ui, 0, 0)
+        mods.update(LEFTSHIFT, 0)
+        mods.end(ui)
+        self.assertEqual(ui.events, [(LEFTSHIFT, 0)])
+        self.assertEqual(mods.virtual, 0)
+
+    def test_engine_shift_held(self):
+        ui = Recorder()
+        engine = Engine(compile_config({'maps': [{'input': 2, 'short': 'ctrl+c'}]}, codes), ui)
+        engine.handle(Event(LEFTSHIFT, 1))
+        engine.handle(Event(2, 1))
+        self.assertEqual(ui.events, [
+            (LEFTSHIFT, 1),
+            # ctrl+c, shift isn't part of it so it's let go first
+            (LEFTSHIFT, 0), (LEFTCTRL, 1), (46, 1), (46, 0), (LEFTCTRL, 0), (LEFTSHIFT, 1)
+        ])
+        engine.close()
+        self.assertEqual(ui.events[-1], (LEFTSHIFT, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from libs.compiler import compile_config
+from libs.store import ACTION_KEYS, ACTION_LAYER, load_tables, save_tables, decode_action
+
+
+# just enough of evdev.ecodes.ecodes for these maps
+codes = {
+    'KEY_LEFTCTRL': 29,
+    'KEY_LEFTSHIFT': 42,
+    'KEY_A': 30,
+    'KEY_C': 46,
+    'KEY_H': 35,
+    'KEY_I': 23
+}
+
+
+class Store_Test(unittest.TestCase):
+    config = {
+        'name': 'Test Device',
+        'maps': [
+            {'input': 2, 'short': 'ctrl+c'},
+            {'input': 3, 'set_layer': 'rotate 0 3'},
+            {'input': 2, 'layer': 1, 'short': 'ctrl+c'},
+            {'input': 4, 'layer': 1, 'macro': '\\Shi'}
+        ]
+    }
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmp.name, 'test.compiled')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        tables = compile_config(self.config, codes)
+        save_tables(tables, self.fname)
+        mapped = load_tables(self.fname)
+        try:
+            self.assertEqual(mapped.name, 'Test Device')
+            # layer 3 has no maps but is a rotate target
+            self.assertEqual(mapped.num_layers, 4)
+            for n in range(tables.num_layers):
+                self.assertEqual(sorted(mapped.layer(n).items()) != [], tables.layer(n) != {})
+                for scancode, off in tables.layer(n).items():
+                    self.assertEqual(decode_action(mapped.blob, mapped.layer(n).get(scancode)),
+                                     decode_action(tables.blob, off))
+            self.assertEqual(decode_action(mapped.blob, mapped.layer(0).get(3)), (ACTION_LAYER, 'rotate', (0, 3)))
+            self.assertEqual(decode_action(mapped.blob, mapped.layer(0).get(2))[0], ACTION_KEYS)
+            self.assertIsNone(mapped.layer(0).get(99))
+            self.assertIsNone(mapped.layer(3).get(2))
+        finally:
+            mapped.close()
+
+    def test_duplicate_records_are_shared(self):
+        save_tables(compile_config(self.config, codes), self.fname)
+        mapped = load_tables(self.fname)
+        try:
+            self.assertEqual(mapped.layer(0).get(2), mapped.layer(1).get(2))
+        finally:
+            mapped.close()
+
+    def test_bad_action_offset(self):
+        save_tables(compile_config(self.config, codes), self.fname)
+        mapped = load_tables(self.fname)
+        start = mapped.layer(0).start
+        mapped.close()
+        # point the first map of layer 0 past the end of the file
+        with open(self.fname, 'r+b') as f:
+            f.seek(start + 4)
+            f.write(b'\xff\xff\x00\x00')
+        mapped = load_tables(self.fname)
+        try:
+            with self.assertRaises(ValueError):
+                mapped.layer(0).get(2)
+        finally:
+            mapped.close()
+
+    def test_bad_file(self):
+        with open(self.fname, 'wb') as f:
+            f.write(b'not a compiled file')
+        with self.assertRaises(ValueError):
+            load_tables(self.fname)
+
+
+if __name__ == '__main__':
+    unittest.main()